@@ -0,0 +1,216 @@
+"""
+Aggregator mode, polls a list of peer Pump Readers and serves a merged snapshot of all of them.
+
+When **aggregator-mode** is set in settings.json the web app does not open any serial ports or
+the ADC, instead a background thread runs an asyncio loop that concurrently posts a
+**getpressures** request to every peer listed in **aggregator-peers**. A single pooled
+keep-alive HTTP session is shared by all peers and each request has its own timeout, so one
+slow or offline Pi does not hold up the rest of the facility. The latest result from each peer
+is cached along with a rolling history of snapshots.
+
+Each entry in **aggregator-peers** is a dictionary:
+    {'name': 'Line 1', 'url': 'http://pumpreader1.local/api', 'api-key': 'xxxx', 'timeout': 2}
+
+**timeout** is optional and defaults to **aggregator-timeout**. For local testing the url can
+point at stand-in instances started with standin_peer.py, e.g. http://127.0.0.1:5001/api
+
+Importing the module does not start polling, call **start()** to start the polling thread.
+"""
+
+import asyncio
+from collections import deque
+from datetime import datetime
+from time import sleep
+from threading import Timer, Lock
+import aiohttp
+from app_control import settings, add_settings_listener
+from logmanager import logger
+
+
+class AggregatorClass:
+    """
+    Polls the configured peer Pump Readers and caches their latest pressures.
+
+    The polling runs in its own thread with a private asyncio event loop. All peers are polled
+    concurrently every **aggregator-interval** seconds through one aiohttp session whose
+    connector keeps the connections to each peer alive between polls.
+
+    Attributes:
+        peers (dict): The latest result for each peer keyed by list position and url.
+        history (deque): Rolling list of merged snapshots, the length is set by
+            **aggregator-history**.
+        updated (str): Timestamp of the last completed polling cycle.
+        lock (Lock): Guards peers and history as they are read by the web threads.
+        reconnect (bool): Set when the session must be rebuilt with new settings.
+    """
+    def __init__(self):
+        self.peers = {}
+        self.history = deque(maxlen=settings['aggregator-history'])
+        self.updated = ''
+        self.lock = Lock()
+        self.reconnect = False
+
+    def start(self):
+        """Start the polling thread and follow changes to the aggregator settings"""
+        logger.info('Initialising aggregator for %s peers', len(settings['aggregator-peers']))
+        add_settings_listener(self.applysettings)
+        timerthread = Timer(1, self.runner)
+        timerthread.name = 'Aggregator'
+        timerthread.start()
+
+    def applysettings(self, changed):
+        """
+        Settings listener, resizes the history when **aggregator-history** changes and rebuilds
+        the pooled session when **aggregator-interval** changes. The peer list and timeouts are
+        read on every cycle so they need no action here.
+        """
+        if 'aggregator-history' in changed:
+            try:
+                with self.lock:
+                    self.history = deque(self.history, maxlen=settings['aggregator-history'])
+                logger.info('Aggregator history length set to %s', settings['aggregator-history'])
+            except (TypeError, ValueError):
+                logger.error('Aggregator: invalid aggregator-history %s', settings['aggregator-history'])
+        if 'aggregator-interval' in changed:
+            self.reconnect = True
+
+    def runner(self):
+        """Thread entry point, runs the asyncio polling loop and restarts it if it fails"""
+        while True:
+            try:
+                asyncio.run(self.poller())
+            except:
+                logger.exception('Aggregator polling loop error: %s', Exception)
+                sleep(5)
+
+    async def poller(self):
+        """
+        Polls every peer concurrently through one pooled keep-alive session, until the
+        **aggregator-interval** setting changes and the session has to be rebuilt. A cycle
+        starts every **aggregator-interval** seconds, the time spent waiting for slow peers is
+        taken off the sleep so the history stays evenly spaced (a peer timeout longer than the
+        interval still delays that cycle).
+
+        The peer list is read from settings on every cycle so that peers can be added or
+        removed without restarting the app.
+        """
+        self.reconnect = False
+        connector = aiohttp.TCPConnector(limit_per_host=2, keepalive_timeout=settings['aggregator-interval'] * 3)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            loop = asyncio.get_running_loop()
+            while not self.reconnect:
+                started = loop.time()
+                peers = settings['aggregator-peers']
+                results = await asyncio.gather(*(self.pollpeer(session, peer) for peer in peers),
+                                               return_exceptions=True)
+                for index, result in enumerate(results):
+                    if isinstance(result, BaseException):
+                        logger.error('Aggregator: peer %s failed: %s', peers[index], result)
+                        results[index] = {'name': 'peer %s' % (index + 1), 'url': '', 'status': str(result),
+                                          'updated': datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
+                                          'pressures': None}
+                self.store(results)
+                await asyncio.sleep(max(0, settings['aggregator-interval'] - (loop.time() - started)))
+
+    async def pollpeer(self, session, peer):
+        """
+        Requests the pressures from a single peer.
+
+        Args:
+            session (aiohttp.ClientSession): The shared pooled session.
+            peer (dict): The peer entry from **aggregator-peers**.
+
+        Returns:
+            dict: name, url, status ('ok', 'timeout' or an error message), updated timestamp
+            and the list of pressures returned by the peer (None if the poll failed).
+        """
+        result = {'name': str(peer), 'url': '', 'status': 'ok',
+                  'updated': datetime.now().strftime('%d/%m/%Y %H:%M:%S'), 'pressures': None}
+        try:
+            result['name'] = str(peer.get('name', peer.get('url', peer)))
+            result['url'] = peer['url']
+            timeout = aiohttp.ClientTimeout(total=peer.get('timeout', settings['aggregator-timeout']))
+            async with session.post(peer['url'], json={'item': 'getpressures'},
+                                    headers={'Api-Key': peer.get('api-key', '')}, timeout=timeout) as response:
+                if response.status == 201 and response.content_type == 'application/json':
+                    data = await response.json()
+                else:
+                    data = await response.text()
+            if response.status == 201 and isinstance(data, list):
+                result['pressures'] = data
+            else:
+                result['status'] = 'HTTP %s: %s' % (response.status, data)
+        except asyncio.TimeoutError:
+            result['status'] = 'timeout'
+        except (aiohttp.ClientError, ValueError) as error:
+            result['status'] = str(error) or error.__class__.__name__
+        except (KeyError, TypeError, AttributeError) as error:
+            result['status'] = 'invalid peer entry (%s: %s)' % (error.__class__.__name__, error)
+        if result['status'] != 'ok':
+            logger.warning('Aggregator: peer %s at %s failed: %s', result['name'], result['url'], result['status'])
+        logger.debug('Aggregator: peer %s returned %s', result['name'], result['pressures'])
+        return result
+
+    def store(self, results):
+        """
+        Merges a polling cycle into the cache. A failed peer keeps its last good pressures
+        (with the failure recorded in its status) so the snapshot always shows the facility.
+        Peers are keyed by their position in **aggregator-peers** and url, the name is only
+        for display so two peers with the same name are both kept.
+        """
+        with self.lock:
+            self.updated = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+            keys = ['%s %s' % (index, result['url']) for index, result in enumerate(results)]
+            for key in list(self.peers.keys()):
+                if key not in keys:
+                    del self.peers[key]
+            for key, result in zip(keys, results):
+                previous = self.peers.get(key)
+                if result['pressures'] is None and previous is not None:
+                    result['pressures'] = previous['pressures']
+                    result['updated'] = previous['updated']
+                self.peers[key] = result
+            self.history.append({'timestamp': self.updated,
+                                 'peers': [{'name': result['name'], 'url': result['url'],
+                                            'pressures': result['pressures']}
+                                           for result in results if result['status'] == 'ok']})
+
+    def snapshot(self):
+        """Return the merged cached snapshot of all peers"""
+        with self.lock:
+            return {'updated': self.updated, 'peers': [dict(peer) for peer in self.peers.values()]}
+
+    def readhistory(self):
+        """Return the cached history of snapshots, oldest first"""
+        with self.lock:
+            return list(self.history)
+
+
+def start():
+    """Start polling the peers, called by app.py when **aggregator-mode** is set"""
+    aggregator.start()
+
+
+def pressures():
+    """
+    Return the merged snapshot of every peer, this replaces pumpclass.pressures() for the
+    **getpressures** api call when running in aggregator mode.
+
+    Returns:
+        dict: updated (str) timestamp of the last polling cycle and peers (list of dict) with
+        the name, url, status, updated timestamp and pressures of each peer.
+    """
+    return aggregator.snapshot()
+
+
+def history():
+    """Return the history of merged snapshots for the **gethistory** api call"""
+    return aggregator.readhistory()
+
+
+def httpstatus():
+    """Return the list of peers for the aggregator status web page"""
+    return aggregator.snapshot()['peers']
+
+
+aggregator = AggregatorClass()
@@ -8,6 +8,8 @@ a pump system. It provides:
 - REST API endpoints for programmatic access to pump data and control functions
 - System monitoring capabilities including CPU temperature and log viewing
 - Remote system control functions (restart)
+- An aggregator mode (settings['aggregator-mode']) that serves a merged snapshot polled from a
+  list of peer Pump Readers instead of reading local gauges, see the aggregator module
 
 The application is designed to run on a Raspberry Pi using Gunicorn as the WSGI server.
 
@@ -21,9 +23,15 @@ import os
 import subprocess
 from threading import Timer, enumerate as enumerate_threads
 from flask import Flask, render_template, jsonify, request
-from pumpclass import httpstatus, pressures
 from logmanager import logger
 from app_control import settings, VERSION
+AGGREGATOR_MODE = settings['aggregator-mode']  # read once, changing the mode needs a restart
+if AGGREGATOR_MODE:
+    import aggregator
+    from aggregator import httpstatus, pressures
+    aggregator.start()
+else:
+    from pumpclass import httpstatus, pressures
 
 
 app = Flask(__name__)
@@ -94,7 +102,8 @@ def index():
     """
     Function that serves as the root endpoint for a web application. It collects various system
     metrics, including CPU temperature, HTTP status pressures, and the number of threads, and
-    renders them along with the application version into an HTML template for display.
+    renders them along with the application version into an HTML template for display. In
+    aggregator mode the status of each peer Pump Reader is shown instead.
 
 
     Returns:
@@ -106,6 +115,9 @@ def index():
              - threadcount: The total number of threads fetched from the threadlister function.
     """
     cputemperature = get_cpu_temperature()
+    if AGGREGATOR_MODE:
+        return render_template('aggregator.html', peers=httpstatus(), cputemperature=cputemperature,
+                               version=VERSION, threadcount=threadlister())
     return render_template('index.html', pressures=httpstatus(), cputemperature=cputemperature,
                            version=VERSION, threadcount=threadlister())
 
@@ -136,6 +148,8 @@ def api():
                 item = request.json['item']
                 if item == 'getpressures':
                     return jsonify(pressures()), 201
+                if item == 'gethistory' and AGGREGATOR_MODE:
+                    return jsonify(aggregator.history()), 201
                 if item == 'restart':
                     if request.json['command'] == 'pi':
                         logger.info('Restart command recieved: system will restart in 15 seconds')
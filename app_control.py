@@ -1,19 +1,35 @@
 """
 Settings module, reads the settings from a settings.json file. If it does not exist or a new setting
 has appeared it will creat from the defaults in the initialise function.
+
+The settings.json file is watched while the app is running, when it changes the new values are
+copied into the **settings** dictionary in place and every function registered with
+**add_settings_listener** is called with the names of the settings that changed. Values that fail
+**checksetting** are logged and ignored, the running values are kept.
 """
+import os
 import random
 import json
+import logging
+from base64 import b64decode
+from time import sleep
 from datetime import datetime
+from threading import Timer
 
-VERSION = '2.3.1'
+VERSION = '2.5.0'
+RESTART_SETTINGS = {'aggregator-mode', 'pressure-vendorid', 'pressure-productid', 'pressure-env',
+                    'logfilepath', 'logappname'}  # only read when the app starts
 
 
 def writesettings():
-    """Write settings to json file"""
+    """Write settings to json file, via a temporary file so a reader never sees a partial file"""
     settings['LastSave'] = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-    with open('settings.json', 'w', encoding='utf-8') as outfile:
+    with open('settings.json.tmp', 'w', encoding='utf-8') as outfile:
         json.dump(settings, outfile, indent=4, sort_keys=True)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+    os.replace('settings.json.tmp', 'settings.json')
+    watcherstate['mtime'] = os.stat('settings.json').st_mtime_ns
 
 def generate_api_key(key_len):
     """generate a new api key"""
@@ -23,6 +39,11 @@ def generate_api_key(key_len):
 def initialise():
     """These are the default values written to the settings.json file the first time the app is run"""
     isettings = {'LastSave': '01/01/2000 00:00:01',
+                 'aggregator-history': 720,
+                 'aggregator-interval': 5,
+                 'aggregator-mode': False,
+                 'aggregator-peers': [],  # list of {'name': , 'url': , 'api-key': , 'timeout': }
+                 'aggregator-timeout': 2,
                  'app-name': 'UCL Helium Line Pump Reader',
                  'api-key': 'change-me',
                  'cputemp': '/sys/class/thermal/thermal_zone0/temp',
@@ -75,6 +96,8 @@ def loadsettings():
     """Replace the default settings with thsoe from the json files"""
     global settings
     settingschanged = False
+    if os.path.exists('settings.json'):
+        watcherstate['mtime'] = os.stat('settings.json').st_mtime_ns
     fsettings = readsettings()
     for item in settings.keys():
         try:
@@ -89,5 +112,129 @@ def loadsettings():
         writesettings()
 
 
+def add_settings_listener(listener):
+    """Register a function to be called as listener(changed) when the settings file changes,
+    changed is the set of setting names whose values are different"""
+    settingslisteners.append(listener)
+
+
+def checksetting(item, newsettings):
+    """
+    Check a reloaded value before it is applied to the running app.
+
+    Args:
+        item (str): The name of the setting.
+        newsettings (dict): The settings as they would be with the new value applied.
+
+    Returns:
+        str: A description of what is wrong with the value, or None if it is valid.
+    """
+    value = newsettings[item]
+    default = initialise()[item]
+    if isinstance(default, bool):
+        if not isinstance(value, bool):
+            return 'must be true or false'
+    elif isinstance(default, (int, float)):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return 'must be a number'
+        if item.endswith(('-speed', '-start', '-length', '-history')) and not isinstance(value, int):
+            return 'must be a whole number'
+        if item.endswith(('-speed', '-interval', '-timeout', '-history')) and value <= 0:
+            return 'must be greater than 0'
+    elif not isinstance(value, type(default)):
+        return 'must be a %s' % type(default).__name__
+    if item.endswith(('-string1', '-string2')):
+        try:
+            b64decode(value, validate=True)
+        except ValueError:
+            return 'must be base64 encoded'
+    if item in ('pressure-min-volt', 'pressure-max-volt'):
+        if newsettings['pressure-min-volt'] == newsettings['pressure-max-volt']:
+            return 'pressure-min-volt and pressure-max-volt must be different'
+    return None
+
+
+def validchanges(fsettings, log):
+    """
+    Compare the settings read from the file with the running settings and check every changed
+    value with **checksetting** before any are applied. An invalid value is logged and ignored
+    along with the other changes sharing its prefix (e.g. all the tank- settings) so a device
+    never runs with half of a new configuration. Changes to the **RESTART_SETTINGS** are logged
+    and left for the next restart.
+
+    Returns:
+        set: The names of the settings that changed and can be applied.
+    """
+    newsettings = dict(settings)
+    changed = set()
+    for item, value in settings.items():
+        if item != 'LastSave' and item in fsettings and fsettings[item] != value:
+            newsettings[item] = fsettings[item]
+            changed.add(item)
+    errors = {}
+    for item in sorted(changed):
+        error = checksetting(item, newsettings)
+        if error:
+            errors[item] = error
+    rejected = {item.split('-')[0] for item in errors}
+    for item in sorted(changed):
+        group = item.split('-')[0]
+        if item in RESTART_SETTINGS:
+            log.warning('Settings reload: %s = %r takes effect after a restart', item, fsettings[item])
+        elif item in errors:
+            log.error('Settings reload: %s = %r ignored, %s', item, fsettings[item], errors[item])
+        elif group in rejected:
+            log.error('Settings reload: %s ignored with the other invalid %s- settings', item, group)
+    return {item for item in changed if item.split('-')[0] not in rejected and item not in RESTART_SETTINGS}
+
+
+def reloadsettings():
+    """
+    Re-read settings.json and apply any valid changed values to the settings dictionary in
+    place so that every module holding a reference to it sees the new values, then notify the
+    listeners. Keys missing from the file keep their current values. If the file cannot be
+    read or parsed the current settings are kept.
+
+    Returns:
+        set: The names of the settings that changed.
+    """
+    log = logging.getLogger(settings['logappname'])
+    try:
+        fsettings = readsettings()
+    except (ValueError, OSError):
+        log.exception('Settings file could not be read, keeping current settings')
+        return set()
+    changed = validchanges(fsettings, log)
+    for item in changed:
+        settings[item] = fsettings[item]
+    if changed:
+        log.info('Settings reloaded, changed: %s', ', '.join(sorted(changed)))
+        for listener in settingslisteners:
+            try:
+                listener(changed)
+            except:
+                log.exception('Settings listener %s failed', listener.__name__)
+    return changed
+
+
+def watchsettings():
+    """Thread that checks settings.json for changes every few seconds and reloads it"""
+    while True:
+        sleep(2)
+        try:
+            mtime = os.stat('settings.json').st_mtime_ns
+        except OSError:
+            continue
+        if mtime != watcherstate['mtime']:
+            watcherstate['mtime'] = mtime
+            reloadsettings()
+
+
+watcherstate = {'mtime': 0}
+settingslisteners = []
 settings = initialise()
 loadsettings()
+watcherthread = Timer(1, watchsettings)
+watcherthread.name = 'Settings Watcher'
+watcherthread.daemon = True
+watcherthread.start()
@@ -6,7 +6,7 @@ write to the log.
 import os
 import logging
 from logging.handlers import RotatingFileHandler
-from app_control import settings
+from app_control import settings, add_settings_listener
 
 # Ensure log directory exists
 log_dir = os.path.dirname(settings['logfilepath'])
@@ -21,10 +21,19 @@ Usage:\n
 **logger.error('message')** for errors
 """
 
-if settings['loglevel'].upper() == 'DEBUG':
-    logger.setLevel(logging.DEBUG)
-else:
-    logger.setLevel(logging.INFO)
+
+def setloglevel(changed=None):
+    """Set the logging level from settings, also called when the settings file is reloaded"""
+    if changed is not None and 'loglevel' not in changed:
+        return
+    if settings['loglevel'].upper() == 'DEBUG':
+        logger.setLevel(logging.DEBUG)
+    else:
+        logger.setLevel(logging.INFO)
+
+
+setloglevel()
+add_settings_listener(setloglevel)
 
 LogFile = RotatingFileHandler(settings['logfilepath'], maxBytes=1048576, backupCount=10)
 formatter = logging.Formatter('%(asctime)s, %(name)s, %(levelname)s : %(message)s')
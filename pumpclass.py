@@ -32,12 +32,12 @@
 
 from time import sleep
 import os
-from threading import Timer
+from threading import Timer, Lock
 from base64 import b64decode
 import serial  # from pyserial
 import hid
 from RPi import GPIO
-from app_control import settings
+from app_control import settings, add_settings_listener
 from logmanager import logger
 
 
@@ -76,23 +76,62 @@ class PumpClass:
         self.port.timeout = 1
         self.value = 0
         self.portready = 0
+        self.readerstarted = False
+        self.lock = Lock()
         self.string1 = b64decode(string1)
         if string2 is None:
             self.string2 = None
         else:
             self.string2 = b64decode(string2)
         logger.info('Initialising %s pump on port %s', self.name, self.port.port)
+        self.openport()
+
+    def openport(self):
+        """Open (or re-open) the serial port and start the reader thread if it is not running"""
         try:
             self.port.close()
             self.port.open()
             logger.info("%s port %s ok", self.name, self.port.port)
             self.portready = 1
-            timerthread = Timer(1, self.serialreader)
-            timerthread.name = self.name
-            timerthread.start()
-        except serial.serialutil.SerialException:
+            if not self.readerstarted:
+                self.readerstarted = True
+                timerthread = Timer(1, self.serialreader)
+                timerthread.name = self.name
+                timerthread.start()
+        except (serial.serialutil.SerialException, ValueError):
+            self.portready = 0
             logger.error("pumpClass error %s opening port %s", self.name, self.port.port)
 
+    def reconfigure(self, prefix):
+        """
+        Apply new settings to a running pump without restarting the app, the values are read
+        from the settings starting with prefix (e.g. 'turbo'), which app_control.checksetting
+        has already validated. The poll strings are decoded before any value is applied. The serial
+        port is only closed and re-opened if the port name or baud rate has changed, or if it
+        is not open, so the other pumps keep reading.
+        """
+        port = settings[prefix + '-port']
+        speed = settings[prefix + '-speed']
+        string1 = b64decode(settings[prefix + '-string1'])
+        if settings.get(prefix + '-string2') is None:
+            string2 = None
+        else:
+            string2 = b64decode(settings[prefix + '-string2'])
+        with self.lock:
+            self.start = settings[prefix + '-start']
+            self.length = settings[prefix + '-length']
+            self.string1 = string1
+            self.string2 = string2
+            if port != self.port.port or speed != self.port.baudrate or not self.port.is_open:
+                logger.info('Reconfiguring %s pump on port %s at %s baud', self.name, port, speed)
+                self.port.close()
+                self.portready = 0
+                self.port.port = port
+                self.port.baudrate = speed
+                self.openport()
+            else:
+                logger.info('Reconfigured %s pump, port %s left open', self.name, self.port.port)
+
     def serialreader(self):
         """
         A method to manage serial communication with a hardware pump. This method handles
@@ -111,16 +150,17 @@ class PumpClass:
         """
         while True:
             try:
-                if self.portready == 1:
-                    self.port.write(self.string1)
-                    sleep(0.5)
-                    if self.string2:
-                        self.port.write(self.string2)
-                    databack = self.port.read(size=100)
-                    self.value = str(databack, 'utf-8')[self.start:self.length]
-                    logger.debug('Pump Return "%s" from %s', self.value, self.name)
-                else:
-                    self.value = 0
+                with self.lock:
+                    if self.portready == 1:
+                        self.port.write(self.string1)
+                        sleep(0.5)
+                        if self.string2:
+                            self.port.write(self.string2)
+                        databack = self.port.read(size=100)
+                        self.value = str(databack, 'utf-8')[self.start:self.length]
+                        logger.debug('Pump Return "%s" from %s', self.value, self.name)
+                    else:
+                        self.value = 0
             except:
                 logger.exception('Pump Error on %s: %s', self.name, Exception)
                 self.value = 0
@@ -183,19 +223,26 @@ class PressureClass:
             None
         """
         while True:
-            if self.conroller is not None:
-                raw = self.adc.value
-                volts = (raw * 5.174) / 65536
-                logger.debug('voltage is %s', volts)
-                if volts <= settings['pressure-min-volt']:
-                    self.value = settings['pressure-min-units']
-                if volts >= settings['pressure-max-volt']:
-                    self.value = settings['pressure-max-units']
-                presurescaler = ((settings['pressure-max-units'] - settings['pressure-min-units']) /
-                                 (settings['pressure-max-volt'] - settings['pressure-min-volt']))
-                self.value = ((volts - settings['pressure-min-volt']) * presurescaler) + settings['pressure-min-units']
-                self.value = round(self.value * 4, 0) / 4
-            else:
+            try:
+                if self.conroller is not None:
+                    minvolt = settings['pressure-min-volt']
+                    maxvolt = settings['pressure-max-volt']
+                    minunits = settings['pressure-min-units']
+                    maxunits = settings['pressure-max-units']
+                    raw = self.adc.value
+                    volts = (raw * 5.174) / 65536
+                    logger.debug('voltage is %s', volts)
+                    if volts <= minvolt:
+                        self.value = minunits
+                    if volts >= maxvolt:
+                        self.value = maxunits
+                    presurescaler = (maxunits - minunits) / (maxvolt - minvolt)
+                    self.value = ((volts - minvolt) * presurescaler) + minunits
+                    self.value = round(self.value * 4, 0) / 4
+                else:
+                    self.value = 1000
+            except:
+                logger.exception('Gas pressure reader error: %s', Exception)
                 self.value = 1000
             sleep(5)
 
@@ -292,6 +339,20 @@ def httpstatus():
             'gas': gasvalue, 'gasunits': settings['pressure-units']}
 
 
+def applysettings(changed):
+    """
+    Settings listener, pushes changes in settings.json to the running pumps. Only the pumps
+    whose own settings changed are reconfigured. The gas pressure calibration and all the units
+    are read from settings on every reading so they take effect without any action here.
+    """
+    for pump, prefix in ((turbopump, 'turbo'), (tankpump, 'tank'), (ionpump, 'ion')):
+        if any(item.startswith(prefix + '-') for item in changed):
+            try:
+                pump.reconfigure(prefix)
+            except:
+                logger.exception('Failed to apply new settings to %s', pump.name)
+
+
 logger.info("pump reader started")
 os.environ[settings['pressure-env']] = "1"  # set an environment variable for the board we are using
 device = hid.enumerate(settings['pressure-vendorid'], settings['pressure-productid'])
@@ -316,5 +377,6 @@ tankpump = PumpClass('Tank Pump', settings['tank-port'], settings['tank-speed'],
 ionpump = PumpClass('Ion Pump', settings['ion-port'], settings['ion-speed'], settings['ion-start'],
                     settings['ion-length'], settings['ion-string1'])
 gaspressure = PressureClass(CONTROLLER)
+add_settings_listener(applysettings)
 logger.info("Pump reader ready")
 GPIO.output(12, 1)  # Set ready LED
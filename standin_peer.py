@@ -0,0 +1,51 @@
+"""
+Stand-in Pump Reader for testing aggregator mode without a Raspberry Pi.
+
+Serves the same **/api** **getpressures** call as app.py with canned readings and the same
+responses for a missing or wrong Api-Key, without opening serial ports, the ADC or GPIO.
+
+Usage:
+    python standin_peer.py --port 5001 --api-key test
+    python standin_peer.py --port 5002 --api-key test --delay 5    (a slow peer, to test timeouts)
+
+then add {'name': 'Stand-in 1', 'url': 'http://127.0.0.1:5001/api', 'api-key': 'test'} to
+**aggregator-peers** in settings.json.
+"""
+import argparse
+import random
+from time import sleep
+from flask import Flask, jsonify, request
+
+
+app = Flask(__name__)
+options = argparse.Namespace(port=5001, api_key='test', delay=0.0)
+
+
+def pressures():
+    """Return canned readings in the same format as pumpclass.pressures()"""
+    return [{'pump': 'turbo', 'pressure': round(random.uniform(1e-7, 2e-7), 9), 'units': 'mbar'},
+            {'pump': 'tank', 'pressure': round(random.uniform(1e-3, 2e-3), 5), 'units': 'mbar'},
+            {'pump': 'ion', 'pressure': round(random.uniform(1e-9, 2e-9), 11), 'units': 'mbar'},
+            {'pump': 'gas', 'pressure': 5.25, 'units': 'bar'}]
+
+
+@app.route('/api', methods=['POST'])
+def api():
+    """Answers getpressures like app.api(), after the configured delay"""
+    sleep(options.delay)
+    if 'Api-Key' not in request.headers.keys():
+        return 'access token(s) incorrect', 401
+    if request.headers['Api-Key'] != options.api_key:
+        return 'access token(s) unuthorised', 401
+    if request.get_json(silent=True, force=True) == {'item': 'getpressures'}:
+        return jsonify(pressures()), 201
+    return 'badly formed json message', 201
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stand-in Pump Reader for testing aggregator mode')
+    parser.add_argument('--port', type=int, default=5001, help='port to listen on (default 5001)')
+    parser.add_argument('--api-key', default='test', help='Api-Key the peer accepts (default test)')
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds to wait before answering')
+    options = parser.parse_args()
+    app.run(host='127.0.0.1', port=options.port, threaded=True)